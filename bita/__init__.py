@@ -1,18 +1,43 @@
+import threading
 import time
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Response
+
+from bita.domain import get_dataset_stats, run_backtest, run_index_levels
+from bita.dtos import (
+    BacktestRequest,
+    BacktestResponse,
+    DatasetStats,
+    IndexLevelRequest,
+    IndexLevelResponse,
+    ReadinessResponse,
+)
+from bita.storage import DatasetNotFoundError
+from bita.warmup import WarmUp
+
+warm_up = WarmUp.from_environment()
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI) -> AsyncIterator[None]:
+    # Runs in the background so that /health answers while the data is loaded
+    threading.Thread(target=warm_up.run, name="warm-up", daemon=True).start()
+    yield
 
-from bita.domain import run_backtest
-from bita.dtos import BacktestRequest, BacktestResponse
 
 app = FastAPI(
     title="Bitacore Mini",
     description="A miniature backtesting API for financial portfolios",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 
-@app.post("/backtest", response_model=BacktestResponse)
+@app.post(
+    "/backtest", response_model=BacktestResponse, response_model_exclude_none=True
+)
 async def backtest(request: BacktestRequest) -> BacktestResponse:
     """
     Run a backtest with the provided configuration.
@@ -27,10 +52,56 @@ async def backtest(request: BacktestRequest) -> BacktestResponse:
     """
     try:
         return run_backtest(request)
+    except DatasetNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e)) from e
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e)) from e
 
 
+@app.post("/backtest/index", response_model=IndexLevelResponse)
+async def backtest_index(request: IndexLevelRequest) -> IndexLevelResponse:
+    """
+    Run a backtest and compute the index built from its weights.
+
+    The weights of each rebalance date are held, drifting with prices, until the
+    next rebalance date. Instead of the weights, the response contains:
+    1. The daily index level, starting at the initial level
+    2. The one-way turnover at each rebalance date
+    3. The drift of the holdings away from their target weights before each rebalance
+
+    Returns:
+        IndexLevelResponse: Contains execution time, index levels, turnover and drift
+    """
+    try:
+        return run_index_levels(request)
+    except DatasetNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e)) from e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e)) from e
+
+
+@app.get("/datasets", response_model=list[DatasetStats])
+async def datasets() -> list[DatasetStats]:
+    """
+    List the datasets with their load time, residency in memory and hit counters.
+    """
+    return get_dataset_stats()
+
+
+@app.get("/ready", response_model=ReadinessResponse)
+async def ready(response: Response) -> ReadinessResponse:
+    """
+    Readiness check endpoint.
+
+    Returns 503 until the configured fields are loaded and the warm-up backtests
+    have run, with the load status of each field.
+    """
+    readiness = warm_up.readiness()
+    if not readiness.ready:
+        response.status_code = 503
+    return readiness
+
+
 @app.get("/health")
 async def health_check() -> dict[str, float]:
     """
@@ -1,10 +1,12 @@
 from __future__ import annotations
 
+from collections.abc import Mapping
 from datetime import date
 from enum import Enum
 
+import numpy as np
 import pandas as pd
-from pydantic import BaseModel, Field, field_validator, model_validator
+from pydantic import BaseModel, ConfigDict, Field, field_validator, model_validator
 
 
 class SecurityValue(str, Enum):
@@ -14,10 +16,26 @@ class SecurityValue(str, Enum):
     ADTV = "adtv_3_month"
 
 
+class ExecutionMode(str, Enum):
+    AUTO = "auto"
+    IN_MEMORY = "in_memory"
+    OUT_OF_CORE = "out_of_core"
+
+
+class LoadStatus(str, Enum):
+    PENDING = "pending"
+    LOADING = "loading"
+    LOADED = "loaded"
+    EVICTED = "evicted"
+    SKIPPED = "skipped"
+    FAILED = "failed"
+
+
 class WeightingMethod(BaseModel):
     lb: float | None = Field(default=None, gt=0)
     ub: float | None = Field(default=None, gt=0)
     d: SecurityValue
+    proportional: bool = False
 
     @model_validator(mode="after")
     def validate_lb(self) -> WeightingMethod:
@@ -51,6 +69,189 @@ class BacktestFilterLowerThanP(AbstractBacktestFilter):
         return data.where(data > self.p).dropna(axis=1)
 
 
+# Number of dates sampled to estimate how selective a threshold is
+SELECTIVITY_SAMPLE = 8
+
+
+class AbstractFilterExpression(BaseModel):
+    def fields(self) -> set[SecurityValue]:
+        raise NotImplementedError
+
+    def selectivity(
+        self, values: Mapping[SecurityValue, np.ndarray], rows: np.ndarray
+    ) -> float:
+        """Estimated fraction of the securities kept by the expression."""
+        raise NotImplementedError
+
+    def mask(
+        self, values: Mapping[SecurityValue, np.ndarray], rows: np.ndarray
+    ) -> np.ndarray:
+        """Boolean matrix of the securities selected at each of the `rows` dates."""
+        raise NotImplementedError
+
+
+class FilterThreshold(AbstractFilterExpression):
+    d: SecurityValue
+    gt: float | None = None
+    lt: float | None = None
+
+    @model_validator(mode="after")
+    def validate_bounds(self) -> FilterThreshold:
+        if self.gt is None and self.lt is None:
+            raise ValueError("gt or lt should be set")
+        return self
+
+    def fields(self) -> set[SecurityValue]:
+        return {self.d}
+
+    def selectivity(
+        self, values: Mapping[SecurityValue, np.ndarray], rows: np.ndarray
+    ) -> float:
+        step = max(1, len(rows) // SELECTIVITY_SAMPLE)
+        return float(self.mask(values, rows[::step][:SELECTIVITY_SAMPLE]).mean())
+
+    def mask(
+        self, values: Mapping[SecurityValue, np.ndarray], rows: np.ndarray
+    ) -> np.ndarray:
+        data = values[self.d][rows]
+        result = np.ones(data.shape, dtype=bool)
+        if self.gt is not None:
+            np.logical_and(result, data > self.gt, out=result)
+        if self.lt is not None:
+            np.logical_and(result, data < self.lt, out=result)
+        return result
+
+
+class FilterTopN(AbstractFilterExpression):
+    d: SecurityValue
+    n: int = Field(gt=0)
+    within: FilterExpression | None = None
+
+    def fields(self) -> set[SecurityValue]:
+        within = self.within.fields() if self.within is not None else set()
+        return {self.d, *within}
+
+    def selectivity(
+        self,
+        values: Mapping[SecurityValue, np.ndarray],
+        rows: np.ndarray,  # noqa: ARG002
+    ) -> float:
+        return min(1.0, self.n / int(values[self.d].shape[1]))
+
+    def mask(
+        self, values: Mapping[SecurityValue, np.ndarray], rows: np.ndarray
+    ) -> np.ndarray:
+        data = values[self.d][rows]
+        eligible = ~np.isnan(data)
+        if self.within is not None:
+            np.logical_and(eligible, self.within.mask(values, rows), out=eligible)
+
+        result = np.zeros(data.shape, dtype=bool)
+        n = min(self.n, data.shape[1])
+        if n == 0:
+            return result
+        ranked = np.where(eligible, -data, np.inf)
+        top = np.argpartition(ranked, n - 1, axis=1)[:, :n]
+        np.put_along_axis(result, top, True, axis=1)
+        np.logical_and(result, eligible, out=result)
+        return result
+
+
+class FilterAnd(AbstractFilterExpression):
+    all: list[FilterExpression] = Field(min_length=1)
+
+    def fields(self) -> set[SecurityValue]:
+        return set().union(*(e.fields() for e in self.all))
+
+    def selectivity(
+        self, values: Mapping[SecurityValue, np.ndarray], rows: np.ndarray
+    ) -> float:
+        return min(e.selectivity(values, rows) for e in self.all)
+
+    def mask(
+        self, values: Mapping[SecurityValue, np.ndarray], rows: np.ndarray
+    ) -> np.ndarray:
+        expressions = sorted(self.all, key=lambda e: e.selectivity(values, rows))
+        result = expressions[0].mask(values, rows)
+        # Dates with no security left are not evaluated by the next expressions
+        active = np.flatnonzero(result.any(axis=1))
+        for expression in expressions[1:]:
+            if active.size == 0:
+                break
+            result[active] &= expression.mask(values, rows[active])
+            active = active[result[active].any(axis=1)]
+        return result
+
+
+class FilterOr(AbstractFilterExpression):
+    any: list[FilterExpression] = Field(min_length=1)
+
+    def fields(self) -> set[SecurityValue]:
+        return set().union(*(e.fields() for e in self.any))
+
+    def selectivity(
+        self, values: Mapping[SecurityValue, np.ndarray], rows: np.ndarray
+    ) -> float:
+        return min(1.0, sum(e.selectivity(values, rows) for e in self.any))
+
+    def mask(
+        self, values: Mapping[SecurityValue, np.ndarray], rows: np.ndarray
+    ) -> np.ndarray:
+        result = self.any[0].mask(values, rows)
+        for expression in self.any[1:]:
+            np.logical_or(result, expression.mask(values, rows), out=result)
+        return result
+
+
+class FilterNot(AbstractFilterExpression):
+    model_config = ConfigDict(populate_by_name=True)
+
+    not_: FilterExpression = Field(alias="not")
+
+    def fields(self) -> set[SecurityValue]:
+        return self.not_.fields()
+
+    def selectivity(
+        self, values: Mapping[SecurityValue, np.ndarray], rows: np.ndarray
+    ) -> float:
+        return 1.0 - self.not_.selectivity(values, rows)
+
+    def mask(
+        self, values: Mapping[SecurityValue, np.ndarray], rows: np.ndarray
+    ) -> np.ndarray:
+        return ~self.not_.mask(values, rows)
+
+
+FilterExpression = FilterThreshold | FilterTopN | FilterAnd | FilterOr | FilterNot
+
+
+class BacktestFilterExpression(BaseModel):
+    expression: FilterExpression
+
+    def fields(self) -> set[SecurityValue]:
+        return self.expression.fields()
+
+    def select(self, data: Mapping[SecurityValue, pd.DataFrame]) -> pd.DataFrame:
+        """
+        Select the securities at each date.
+
+        Args:
+            data: Data frames of every field in the expression, with the same dates
+                and securities
+
+        Returns:
+            Boolean DataFrame of the selected securities, without the securities
+            that are never selected
+        """
+        first = next(iter(data.values()))
+        values = {d: df.to_numpy() for d, df in data.items()}
+        mask = self.expression.mask(values, np.arange(len(first.index)))
+        selected = mask.any(axis=0)
+        return pd.DataFrame(
+            mask[:, selected], index=first.index, columns=first.columns[selected]
+        )
+
+
 class AbstractDateFactory(BaseModel):
     def get_dates(self) -> pd.DatetimeIndex:
         raise NotImplementedError
@@ -0,0 +1,255 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+from collections.abc import Iterable
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import date
+from typing import TypeVar
+
+import httpx
+import pandas as pd
+from pydantic import BaseModel
+
+from .dtos import (
+    BacktestRequest,
+    BacktestResponse,
+    IndexLevelRequest,
+    IndexLevelResponse,
+)
+
+DEFAULT_URL = "http://localhost:8000"
+DEFAULT_TIMEOUT = httpx.Timeout(60.0, connect=5.0)
+
+ResponseT = TypeVar("ResponseT", bound=BaseModel)
+
+
+def weights_frame(response: BacktestResponse) -> pd.DataFrame:
+    """
+    Build a DataFrame of weights with one row per date and one column per security.
+
+    The full weights of every date are reconstructed from delta encoded responses.
+    """
+    df = pd.DataFrame.from_dict(decode_weights(response), orient="index")
+    df.index = pd.DatetimeIndex(df.index)
+    return df
+
+
+def decode_weights(response: BacktestResponse) -> dict[date, dict[str, float]]:
+    """
+    Get the full weights of every date from a response, delta encoded or not.
+
+    The deltas are applied in the order of the response, the order of the calendar.
+    """
+    if response.deltas is None:
+        return response.weights
+
+    weights_by_date = dict(response.weights)
+    weights = dict(next(iter(response.weights.values()), {}))
+    for day, delta in response.deltas.items():
+        weights.update(delta.updated)
+        for security in delta.removed:
+            del weights[security]
+        weights_by_date[day] = dict(weights)
+    return weights_by_date
+
+
+def index_frame(response: IndexLevelResponse) -> pd.DataFrame:
+    """
+    Build a DataFrame with the daily index level and the turnover and drift columns
+    filled at the rebalance dates.
+    """
+    df = pd.DataFrame(
+        {
+            "level": pd.Series(response.levels, dtype=float),
+            "turnover": pd.Series(response.turnover, dtype=float),
+            "drift": pd.Series(response.drift, dtype=float),
+        }
+    )
+    df.index = pd.DatetimeIndex(df.index)
+    return df.sort_index()
+
+
+def _limits(max_connections: int) -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_connections,
+    )
+
+
+class BacktestClient:
+    """
+    Client of the backtesting API.
+
+    Requests share a pool of keep-alive connections and identical requests made while
+    one of them is still in flight wait for its response instead of being sent again.
+    HTTP/2 is only negotiated over HTTPS, with a proxy speaking it in front of the
+    API, otherwise each request in flight has its own HTTP/1.1 connection.
+    """
+
+    __slots__ = ("_client", "_in_flight", "_lock", "_max_concurrency")
+
+    def __init__(
+        self,
+        base_url: str = DEFAULT_URL,
+        *,
+        max_concurrency: int = 8,
+        timeout: httpx.Timeout = DEFAULT_TIMEOUT,
+        transport: httpx.BaseTransport | None = None,
+    ) -> None:
+        self._client = httpx.Client(
+            base_url=base_url,
+            http2=True,
+            limits=_limits(max_concurrency),
+            timeout=timeout,
+            transport=transport,
+        )
+        self._max_concurrency = max_concurrency
+        self._in_flight: dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> BacktestClient:
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._client.close()
+
+    def backtest(self, request: BacktestRequest) -> BacktestResponse:
+        return self._coalesce("/backtest", request, BacktestResponse)
+
+    def index_levels(self, request: IndexLevelRequest) -> IndexLevelResponse:
+        return self._coalesce("/backtest/index", request, IndexLevelResponse)
+
+    def backtest_many(
+        self, requests: Iterable[BacktestRequest]
+    ) -> list[BacktestResponse]:
+        """
+        Run the backtests with at most `max_concurrency` of them in flight at once.
+
+        Returns:
+            Responses in the same order as the requests
+        """
+        with ThreadPoolExecutor(max_workers=self._max_concurrency) as executor:
+            return list(executor.map(self.backtest, requests))
+
+    def _coalesce(
+        self, url: str, request: BaseModel, response_type: type[ResponseT]
+    ) -> ResponseT:
+        key = f"{url} {request.model_dump_json(by_alias=True)}"
+        with self._lock:
+            future = self._in_flight.get(key)
+            owner = future is None
+            if future is None:
+                future = self._in_flight[key] = Future()
+
+        if owner:
+            try:
+                future.set_result(self._post(url, request, response_type))
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    del self._in_flight[key]
+        result: ResponseT = future.result()
+        return result
+
+    def _post(
+        self, url: str, request: BaseModel, response_type: type[ResponseT]
+    ) -> ResponseT:
+        response = self._client.post(
+            url,
+            content=request.model_dump_json(by_alias=True),
+            headers={"Content-Type": "application/json"},
+        )
+        response.raise_for_status()
+        return response_type.model_validate_json(response.content)
+
+
+class AsyncBacktestClient:
+    """
+    Asynchronous client of the backtesting API.
+
+    Requests share a pool of keep-alive connections and identical requests made while
+    one of them is still in flight wait for its response instead of being sent again.
+    HTTP/2 is only negotiated over HTTPS, with a proxy speaking it in front of the
+    API, otherwise each request in flight has its own HTTP/1.1 connection.
+    """
+
+    __slots__ = ("_client", "_in_flight", "_max_concurrency")
+
+    def __init__(
+        self,
+        base_url: str = DEFAULT_URL,
+        *,
+        max_concurrency: int = 8,
+        timeout: httpx.Timeout = DEFAULT_TIMEOUT,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ) -> None:
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            http2=True,
+            limits=_limits(max_concurrency),
+            timeout=timeout,
+            transport=transport,
+        )
+        self._max_concurrency = max_concurrency
+        self._in_flight: dict[str, asyncio.Future] = {}
+
+    async def __aenter__(self) -> AsyncBacktestClient:
+        return self
+
+    async def __aexit__(self, *_: object) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+    async def backtest(self, request: BacktestRequest) -> BacktestResponse:
+        return await self._coalesce("/backtest", request, BacktestResponse)
+
+    async def index_levels(self, request: IndexLevelRequest) -> IndexLevelResponse:
+        return await self._coalesce("/backtest/index", request, IndexLevelResponse)
+
+    async def backtest_many(
+        self, requests: Iterable[BacktestRequest]
+    ) -> list[BacktestResponse]:
+        """
+        Run the backtests with at most `max_concurrency` of them in flight at once.
+
+        Returns:
+            Responses in the same order as the requests
+        """
+        semaphore = asyncio.Semaphore(self._max_concurrency)
+
+        async def bounded(request: BacktestRequest) -> BacktestResponse:
+            async with semaphore:
+                return await self.backtest(request)
+
+        return await asyncio.gather(*(bounded(request) for request in requests))
+
+    async def _coalesce(
+        self, url: str, request: BaseModel, response_type: type[ResponseT]
+    ) -> ResponseT:
+        key = f"{url} {request.model_dump_json(by_alias=True)}"
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._post(url, request, response_type))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        # A cancelled caller must not cancel the request for the others
+        result: ResponseT = await asyncio.shield(task)
+        return result
+
+    async def _post(
+        self, url: str, request: BaseModel, response_type: type[ResponseT]
+    ) -> ResponseT:
+        response = await self._client.post(
+            url,
+            content=request.model_dump_json(by_alias=True),
+            headers={"Content-Type": "application/json"},
+        )
+        response.raise_for_status()
+        return response_type.model_validate_json(response.content)
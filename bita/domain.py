@@ -1,10 +1,56 @@
+import os
 import time
+from collections.abc import Iterator
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
 
-from .application import WeightingMethod
-from .dtos import BacktestRequest, BacktestResponse
+from .application import (
+    BacktestFilterExpression,
+    ExecutionMode,
+    SecurityValue,
+    WeightingMethod,
+)
+from .dtos import (
+    BacktestRequest,
+    BacktestResponse,
+    BaseBacktestRequest,
+    DatasetStats,
+    IndexLevelRequest,
+    IndexLevelResponse,
+    WeightsDelta,
+)
+from .storage import BYTES_PER_VALUE, DatasetStore
+
+# Memory that a backtest may use to hold the data fields before it is run out of core
+MEMORY_BUDGET = int(os.environ.get("BITA_MEMORY_BUDGET_MB", "1024")) * 1024**2
+
+DATA_DIR = Path(
+    os.environ.get("BITA_DATA_DIR", Path(__file__).resolve().parent.parent / "data")
+)
+# Fields held and computed as float32: "all" or a comma separated list of fields
+FLOAT32_FIELDS = os.environ.get("BITA_FLOAT32_FIELDS", "")
+
+
+def _parse_float32_fields(value: str) -> frozenset[str]:
+    fields = {d.value for d in SecurityValue}
+    if value == "all":
+        return frozenset(fields)
+    names = frozenset(name.strip() for name in value.split(",") if name.strip())
+    if unknown := names - fields:
+        raise ValueError(
+            f"Unknown fields in BITA_FLOAT32_FIELDS: {sorted(unknown)}, "
+            f"expected 'all' or some of {sorted(fields)}"
+        )
+    return names
+
+
+STORE = DatasetStore(
+    DATA_DIR,
+    int(os.environ.get("BITA_STORE_MEMORY_MB", "2048")) * 1024**2,
+    float32_fields=_parse_float32_fields(FLOAT32_FIELDS),
+)
 
 
 def run_backtest(request: BacktestRequest) -> BacktestResponse:
@@ -19,31 +65,228 @@ def run_backtest(request: BacktestRequest) -> BacktestResponse:
     """
     start_time = time.perf_counter()
 
+    if request.delta:
+        df_weights = _run_weights(request)
+        if not df_weights.empty:
+            # Encoded in the order of the calendar, the same as the full weights
+            df_weights = df_weights[~df_weights.index.duplicated()]
+            df_weights = df_weights.loc[
+                request.calendar_rule.get_dates().intersection(
+                    df_weights.index, sort=False
+                )
+            ]
+        weights_by_date, deltas = _encode_weight_deltas(
+            df_weights, request.delta_tolerance
+        )
+        execution_time = time.perf_counter() - start_time
+        return BacktestResponse(
+            execution_time=execution_time, weights=weights_by_date, deltas=deltas
+        )
+
+    weights_by_date = {}
+    for df_weights in _iter_weights(request):
+        weights_by_date.update(_weights_to_dict(df_weights))
+    # Out of core batches come in the order of the file, not of the calendar
+    weights_by_date = {
+        date: weights_by_date[date]
+        for date in request.calendar_rule.get_dates().unique()
+        if date in weights_by_date
+    }
+
+    execution_time = time.perf_counter() - start_time
+
+    return BacktestResponse(execution_time=execution_time, weights=weights_by_date)
+
+
+def run_index_levels(request: IndexLevelRequest) -> IndexLevelResponse:
+    """
+    Run a backtest and compute the index level series from its weights.
+
+    Args:
+        request: Backtest configuration with the initial index level
+
+    Returns:
+        Daily index levels, turnover per rebalance and drift between rebalances
+    """
+    start_time = time.perf_counter()
+
+    df_weights = _run_weights(request)
+    if df_weights.empty:
+        levels, turnover, drift = {}, {}, {}
+    else:
+        df_prices = _read_parquet(
+            STORE,
+            request.dataset,
+            SecurityValue.PRICES.value,
+            columns=list(df_weights.columns),
+        )
+        levels_s, turnover_s, drift_s = _calculate_index_levels(
+            df_weights, df_prices, request.initial_level
+        )
+        levels = levels_s.to_dict()
+        turnover = turnover_s.to_dict()
+        drift = drift_s.to_dict()
+
+    execution_time = time.perf_counter() - start_time
+
+    return IndexLevelResponse(
+        execution_time=execution_time,
+        levels=levels,
+        turnover=turnover,
+        drift=drift,
+    )
+
+
+def get_dataset_stats() -> list[DatasetStats]:
+    """
+    Get the load time, residency and hit counters of every dataset in the store.
+    """
+    return [DatasetStats(**stats) for stats in STORE.stats()]
+
+
+def run_weights_in_memory(
+    request: BaseBacktestRequest, store: DatasetStore
+) -> pd.DataFrame:
+    """
+    Calculate the weights of a backtest with the fields of a store held in memory.
+
+    Args:
+        request: Backtest configuration
+        store: Store to read the fields from
+
+    Returns:
+        DataFrame with the securities weights at each date, NaN for the securities
+        not selected
+    """
     calendar_dates = request.calendar_rule.get_dates()
-    df_filter = _read_parquet(request.backtest_filter.d.value).loc[calendar_dates]
-    securities_filtered = request.backtest_filter.apply_filter(df_filter)
+    selection: pd.DataFrame | None = None
+    if isinstance(request.backtest_filter, BacktestFilterExpression):
+        selection = request.backtest_filter.select(
+            _read_aligned_fields(
+                store, request.dataset, request.backtest_filter.fields(), calendar_dates
+            )
+        )
+        securities_filtered = selection
+    else:
+        df_filter = _read_parquet(
+            store, request.dataset, request.backtest_filter.d.value
+        ).loc[calendar_dates]
+        securities_filtered = request.backtest_filter.apply_filter(df_filter)
 
     try:
         # NOTE: If this often happens a if statement would be better
-        df_weights = _read_parquet(request.weighting_method.d.value)
-        weights_by_date = _calculate_weights(
+        df_weights = _read_parquet(
+            store, request.dataset, request.weighting_method.d.value
+        )
+        return _calculate_weights(
             request.weighting_method,
             securities_filtered.columns,
             df_weights,
             securities_filtered.index,
-        ).to_dict("index")
+            selection,
+        )
     except ZeroDivisionError:
-        weights_by_date = {}
+        return pd.DataFrame()
 
-    execution_time = time.perf_counter() - start_time
 
-    return BacktestResponse(execution_time=execution_time, weights=weights_by_date)
+def _run_weights(request: BaseBacktestRequest) -> pd.DataFrame:
+    frames = [df for df in _iter_weights(request) if not df.empty]
+    return pd.concat(frames) if frames else pd.DataFrame()
+
+
+def _iter_weights(request: BaseBacktestRequest) -> Iterator[pd.DataFrame]:
+    if _use_out_of_core(request):
+        yield from _iter_weights_out_of_core(request, MEMORY_BUDGET)
+    else:
+        yield run_weights_in_memory(request, STORE)
+
+
+def _use_out_of_core(request: BaseBacktestRequest) -> bool:
+    if isinstance(request.backtest_filter, BacktestFilterExpression):
+        return False
+
+    if request.execution_mode != ExecutionMode.AUTO:
+        return request.execution_mode == ExecutionMode.OUT_OF_CORE
+
+    fields = {request.backtest_filter.d.value, request.weighting_method.d.value}
+    working_set = sum(
+        STORE.field(request.dataset, field).size()
+        for field in fields
+        if not STORE.is_resident(request.dataset, field)
+    )
+    return working_set > MEMORY_BUDGET
+
+
+def _read_aligned_fields(
+    store: DatasetStore,
+    dataset: str,
+    fields: set[SecurityValue],
+    dates: pd.DatetimeIndex,
+) -> dict[SecurityValue, pd.DataFrame]:
+    data = {d: _read_parquet(store, dataset, d.value).loc[dates] for d in fields}
+    columns = pd.Index([])
+    for i, df in enumerate(data.values()):
+        columns = df.columns if i == 0 else columns.intersection(df.columns, sort=False)
+    return {
+        d: df if df.columns.equals(columns) else df[columns] for d, df in data.items()
+    }
+
+
+def _iter_weights_out_of_core(
+    request: BaseBacktestRequest, memory_budget: int
+) -> Iterator[pd.DataFrame]:
+    """
+    Calculate the weights streaming the data fields from disk.
+
+    The filter field is read in batches of securities at the calendar dates. Each
+    batch is filtered together with the securities kept so far, which gives the
+    same selection as filtering all of them at once because a security is only
+    ever dropped by comparing it with its own values or the values of the others.
+    The weighting field is then read in batches of dates for the selected securities
+    and the weights of each batch are yielded as soon as they are calculated.
+
+    Args:
+        request: Backtest configuration
+        memory_budget: Bytes that the batches read from disk may use
+
+    Returns:
+        Iterator over DataFrames with the securities weights of a batch of dates
+    """
+    backtest_filter = request.backtest_filter
+    assert not isinstance(backtest_filter, BacktestFilterExpression), (
+        "Filter expressions are only run in memory"
+    )
+    calendar_dates = request.calendar_rule.get_dates()
+    # Room for the values decoded from the file, their DataFrame and the values kept
+    # or calculated from them
+    batch_values = max(1, memory_budget // (4 * BYTES_PER_VALUE))
 
+    df_filter = STORE.field(request.dataset, backtest_filter.d.value)
+    securities_filtered: pd.DataFrame | None = None
+    for df_batch in df_filter.iter_columns(calendar_dates, batch_values):
+        if securities_filtered is not None:
+            df_batch = pd.concat([securities_filtered, df_batch], axis=1)
+        securities_filtered = backtest_filter.apply_filter(df_batch)
 
-def _read_parquet(path: str) -> pd.DataFrame:
-    project_root = Path(__file__).resolve().parent.parent
-    file_path = project_root / "data" / f"{path}.parquet"
-    return pd.read_parquet(file_path)
+    if securities_filtered is None or securities_filtered.columns.empty:
+        return
+
+    securities = securities_filtered.columns
+    df_weights = STORE.field(request.dataset, request.weighting_method.d.value)
+    for df_batch in df_weights.iter_rows(securities, calendar_dates, batch_values):
+        yield _calculate_weights(
+            request.weighting_method, securities, df_batch, df_batch.index
+        )
+
+
+def _read_parquet(
+    store: DatasetStore, dataset: str, field: str, columns: list[str] | None = None
+) -> pd.DataFrame:
+    if columns is None:
+        return store.get(dataset, field)
+    if store.is_resident(dataset, field):
+        return store.get(dataset, field)[columns]
+    return store.read(dataset, field, columns)
 
 
 def _calculate_weights(
@@ -51,6 +294,7 @@ def _calculate_weights(
     securities: pd.Index,
     data: pd.DataFrame,
     dates: pd.DatetimeIndex,
+    selection: pd.DataFrame | None = None,
 ) -> pd.DataFrame:
     """
     Calculate weights for the selected securities based on the weighting method.
@@ -60,14 +304,29 @@ def _calculate_weights(
         securities: List of selected security IDs
         data: Data frame containing the data field values
         dates: Current date to calculate weights for|
+        selection: Boolean data frame of the securities selected at each date, when
+            they aren't the same at every date
 
     Returns:
-        DataFrame with securities weights
+        DataFrame with securities weights, NaN for the securities not selected
     """
     df = data.loc[dates].filter(securities)
+    if selection is not None:
+        if securities.empty:
+            raise ZeroDivisionError("No securities selected")
+        df = df.where(selection)
+    if weighting_method.proportional:
+        return _calculate_capped_proportional_weights(
+            df,
+            weighting_method.lb if weighting_method.lb is not None else 0.0,
+            weighting_method.ub if weighting_method.ub is not None else 1.0,
+        )
+
     if weighting_method.empty_bounds():
-        df[:] = 1 / len(securities)
-        return df
+        if selection is not None:
+            return selection.div(selection.sum(axis=1), axis=0).where(selection)
+        # Built anew so that float32 data still gets float64 weights
+        return pd.DataFrame(1 / len(securities), index=df.index, columns=df.columns)
 
     assert weighting_method.lb is not None and weighting_method.ub is not None, (
         "Bounds must not be None here"
@@ -76,6 +335,7 @@ def _calculate_weights(
 
 
 def _calculate_row_weight(df_row: pd.Series, lb: float, ub: float) -> pd.Series:
+    df_row = df_row.dropna()
     n = len(df_row)
 
     sorted_series = df_row.sort_values(ascending=False)
@@ -102,3 +362,208 @@ def _calculate_optimized_weights(
     data: pd.DataFrame, lb: float, ub: float
 ) -> pd.DataFrame:
     return data.apply(_calculate_row_weight, lb=lb, ub=ub, axis=1)
+
+
+def _calculate_capped_proportional_weights(
+    data: pd.DataFrame, lb: float, ub: float, iterations: int = 100
+) -> pd.DataFrame:
+    """
+    Calculate weights proportional to the data values and clipped to [lb, ub].
+
+    The weights are `clip(s * v, lb, ub)` for the scale `s` of each date that makes
+    them sum to one. As the sum only grows with `s`, the scale is found with a
+    bisection of every date at once, between a scale at which every weight is at
+    most `lb` or the unclipped weights with `lb` added sum to one, and one at which
+    every weight is at least `ub`. The securities at each bound are then taken from
+    that scale and the exact scale of the others is solved from them.
+
+    Args:
+        data: Data frame with the values of the selected securities at each date
+        lb: Lower bound of the weights
+        ub: Upper bound of the weights
+        iterations: Iterations of the bisection, on the logarithm of the scale
+
+    Returns:
+        DataFrame with securities weights, NaN for the securities without a value
+
+    Raises:
+        ValueError: If the bounds cannot be met by the securities of a date
+    """
+    values = data.to_numpy()
+    if values.dtype != np.float32:
+        values = values.astype(np.float64, copy=False)
+    selected = ~np.isnan(values)
+    values = np.where(selected, values, 0.0)
+    positive = selected & (values > 0)
+    counts = selected.sum(axis=1)
+    # Securities without a positive value are at lb whatever the scale
+    max_total = ub * positive.sum(axis=1) + lb * (counts - positive.sum(axis=1))
+    infeasible = (counts > 0) & ((max_total < 1) | (counts * lb > 1))
+    if infeasible.any():
+        raise ValueError(
+            f"Weights cannot be bounded by [{lb}, {ub}] at "
+            f"{list(data.index[infeasible])}"
+        )
+
+    rows = counts > 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        low = np.maximum(
+            (1 - counts * lb) / values.sum(axis=1), lb / values.max(axis=1)
+        )
+        high = ub / np.where(positive, values, np.inf).min(axis=1)
+    low = np.where(rows, low, 1.0)[:, np.newaxis]
+    high = np.where(rows, high, 1.0)[:, np.newaxis]
+    for _ in range(iterations):
+        scale = np.sqrt(low * high)
+        weights = np.clip(scale.astype(values.dtype) * values, lb, ub)
+        below = np.where(selected, weights, 0.0).sum(axis=1, keepdims=True) < 1
+        low = np.where(below, scale, low)
+        high = np.where(below, high, scale)
+
+    scaled = np.sqrt(low * high).astype(values.dtype) * values
+    at_ub = (scaled >= ub) & selected
+    at_lb = (scaled <= lb) & selected & ~at_ub
+    scale = _free_scale(values, at_ub, at_lb, lb, ub)
+    weights = np.where(at_ub, ub, np.where(at_lb, lb, scale * values))
+    weights = np.where(selected, weights, 0.0).astype(np.float64)
+    # Normalised in float64 to remove the rounding of float32 data
+    with np.errstate(divide="ignore", invalid="ignore"):
+        weights /= weights.sum(axis=1, keepdims=True)
+
+    tolerance = 64 * np.finfo(values.dtype).eps
+    if ((weights < lb - tolerance) | (weights > ub + tolerance))[selected].any():
+        raise ValueError(f"Weights could not be bounded by [{lb}, {ub}]")
+    weights[~selected] = np.nan
+    return pd.DataFrame(weights, index=data.index, columns=data.columns)
+
+
+def _free_scale(
+    values: np.ndarray, at_ub: np.ndarray, at_lb: np.ndarray, lb: float, ub: float
+) -> np.ndarray:
+    """
+    Scale of the values of the securities at neither bound, so that every row sums
+    to one.
+    """
+    remaining = (1 - ub * at_ub.sum(axis=1) - lb * at_lb.sum(axis=1)).astype(
+        values.dtype
+    )
+    free_values = np.where(at_ub | at_lb, 0.0, values).sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(free_values > 0, remaining / free_values, 0.0)[:, np.newaxis]
+
+
+def _weights_to_dict(df: pd.DataFrame) -> dict:
+    weights_by_date: dict = df.to_dict("index")
+    if not df.isna().to_numpy().any():
+        return weights_by_date
+    return {
+        index: {
+            security: weight for security, weight in row.items() if pd.notna(weight)
+        }
+        for index, row in weights_by_date.items()
+    }
+
+
+def _encode_weight_deltas(
+    df: pd.DataFrame, tolerance: float
+) -> tuple[dict, dict[pd.Timestamp, WeightsDelta]]:
+    """
+    Encode the weights as the full weights of the first date and the changes of
+    every next date, in the order of the rows.
+
+    A weight is only sent again when it moves more than `tolerance` away from the
+    last weight sent for the security, so the error of the decoded weights never
+    accumulates beyond the tolerance.
+
+    Args:
+        df: Weights with one row per date, NaN for the securities not selected
+        tolerance: Absolute change of a weight below which it isn't sent
+
+    Returns:
+        Weights of the first date and changes of the next ones, by date
+    """
+    if df.empty:
+        return {}, {}
+
+    df = df[~df.index.duplicated()]
+    securities = df.columns.to_numpy()
+    weights = df.to_numpy(dtype=float)
+    sent = weights[0].copy()
+
+    deltas = {}
+    for date, row in zip(df.index[1:], weights[1:], strict=True):
+        present = ~np.isnan(row)
+        with np.errstate(invalid="ignore"):
+            updated = present & ~(np.abs(row - sent) <= tolerance)
+        removed = ~present & ~np.isnan(sent)
+        sent[updated] = row[updated]
+        sent[removed] = np.nan
+        deltas[date] = WeightsDelta(
+            updated=dict(zip(securities[updated], row[updated].tolist(), strict=True)),
+            removed=securities[removed].tolist(),
+        )
+
+    return _weights_to_dict(df.iloc[:1]), deltas
+
+
+def _calculate_index_levels(
+    weights: pd.DataFrame, prices: pd.DataFrame, initial_level: float
+) -> tuple[pd.Series, pd.Series, pd.Series]:
+    """
+    Calculate the daily index level from the weights set at each rebalance date.
+
+    Weights are applied at the close of each rebalance date and drift with the
+    prices until the close of the next one. The weight left out, such as at a
+    rebalance date without any security selected, is held as cash. Every date is computed at once: each
+    daily row is mapped to the segment of its last rebalance, so the whole series
+    is a handful of matrix operations instead of a loop over dates.
+
+    Args:
+        weights: Target weights with one row per rebalance date
+        prices: Daily prices for, at least, the weighted securities
+        initial_level: Index level at the first rebalance date
+
+    Returns:
+        Daily index levels, one-way turnover at each rebalance date and the
+        one-way drift accumulated by the holdings up to each rebalance date
+    """
+    weights = weights[~weights.index.duplicated()].sort_index().fillna(0.0)
+    rebalance_dates = weights.index
+    prices = prices.sort_index().loc[rebalance_dates[0] :, weights.columns]
+
+    w = weights.to_numpy(dtype=float)
+    p = prices.to_numpy(dtype=float)
+    rebalance_pos = prices.index.get_indexer(rebalance_dates)
+    if (rebalance_pos < 0).any():
+        missing = rebalance_dates[rebalance_pos < 0]
+        raise KeyError(f"Missing prices for rebalance dates: {list(missing)}")
+
+    # The weight not invested, all of it at a date without any security selected, is
+    # held as cash until the next rebalance: one more asset whose price never moves
+    w = np.hstack((w, 1 - w.sum(axis=1, keepdims=True)))
+    p = np.hstack((p, np.ones((len(p), 1))))
+
+    # A rebalance date closes the previous segment, the new weights start after it
+    segment = np.searchsorted(rebalance_pos, np.arange(len(p)), side="left") - 1
+    segment[0] = 0
+
+    growth = (w[segment] * (p / p[rebalance_pos][segment])).sum(axis=1)
+    segment_growth = growth[rebalance_pos[1:]]
+    start_levels = initial_level * np.concatenate(([1.0], np.cumprod(segment_growth)))
+    levels = start_levels[segment] * growth
+
+    drifted = (
+        w[:-1]
+        * (p[rebalance_pos[1:]] / p[rebalance_pos[:-1]])
+        / segment_growth[:, np.newaxis]
+    )
+    # The index starts all in cash
+    previous = np.vstack((np.eye(1, w.shape[1], w.shape[1] - 1), drifted))
+    turnover = np.clip(w - previous, 0.0, None).sum(axis=1)
+    drift = 0.5 * np.abs(drifted - w[:-1]).sum(axis=1)
+
+    return (
+        pd.Series(levels, index=prices.index),
+        pd.Series(turnover, index=rebalance_dates),
+        pd.Series(drift, index=rebalance_dates[1:]),
+    )
@@ -1,22 +1,77 @@
 from datetime import date
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, model_validator
 
 from .application import (
+    BacktestFilterExpression,
     BacktestFilterLowerThanP,
     BacktestFilterTopN,
     CustomDatesRule,
+    ExecutionMode,
+    LoadStatus,
     QuarterlyDatesRule,
     WeightingMethod,
 )
+from .storage import DEFAULT_DATASET
 
 
-class BacktestRequest(BaseModel):
+class BaseBacktestRequest(BaseModel):
     calendar_rule: CustomDatesRule | QuarterlyDatesRule
-    backtest_filter: BacktestFilterTopN | BacktestFilterLowerThanP
+    backtest_filter: (
+        BacktestFilterTopN | BacktestFilterLowerThanP | BacktestFilterExpression
+    )
     weighting_method: WeightingMethod
+    execution_mode: ExecutionMode = ExecutionMode.AUTO
+    dataset: str = DEFAULT_DATASET
+
+    @model_validator(mode="after")
+    def validate_execution_mode(self) -> "BaseBacktestRequest":
+        if (
+            isinstance(self.backtest_filter, BacktestFilterExpression)
+            and self.execution_mode == ExecutionMode.OUT_OF_CORE
+        ):
+            raise ValueError("Filter expressions can only be run in memory")
+        return self
+
+
+class BacktestRequest(BaseBacktestRequest):
+    delta: bool = False
+    delta_tolerance: float = Field(default=0.0, ge=0)
+
+
+class WeightsDelta(BaseModel):
+    updated: dict[str, float] = {}
+    removed: list[str] = []
 
 
 class BacktestResponse(BaseModel):
     execution_time: float
     weights: dict[date, dict[str, float]]
+    deltas: dict[date, WeightsDelta] | None = None
+
+
+class IndexLevelRequest(BaseBacktestRequest):
+    initial_level: float = Field(default=100.0, gt=0)
+
+
+class IndexLevelResponse(BaseModel):
+    execution_time: float
+    levels: dict[date, float]
+    turnover: dict[date, float]
+    drift: dict[date, float]
+
+
+class DatasetStats(BaseModel):
+    name: str
+    hits: int
+    misses: int
+    evictions: int
+    load_time: float
+    resident_bytes: int
+    resident_fields: list[str]
+
+
+class ReadinessResponse(BaseModel):
+    ready: bool
+    warm_up_time: float | None
+    fields: dict[str, dict[str, LoadStatus]]
@@ -0,0 +1,108 @@
+"""
+Compare the weights calculated with the fields held as float32 against float64.
+
+Usage: python -m bita.precision --path ./data
+"""
+
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+
+from .application import SecurityValue
+from .domain import run_weights_in_memory
+from .dtos import BacktestRequest
+from .storage import DEFAULT_DATASET, DatasetStore
+
+DEFAULT_REQUESTS = (
+    {
+        "calendar_rule": {"initial_date": "2020-01-01"},
+        "backtest_filter": {"n": 50, "d": "market_capitalization"},
+        "weighting_method": {"d": "market_capitalization"},
+    },
+    {
+        "calendar_rule": {"initial_date": "2020-01-01"},
+        "backtest_filter": {"p": 50.0, "d": "prices"},
+        "weighting_method": {"d": "volume", "lb": 0.0001, "ub": 0.05},
+    },
+    {
+        "calendar_rule": {"initial_date": "2020-01-01"},
+        "backtest_filter": {
+            "expression": {
+                "d": "market_capitalization",
+                "n": 100,
+                "within": {"d": "adtv_3_month", "gt": 20.0},
+            }
+        },
+        "weighting_method": {
+            "d": "market_capitalization",
+            "ub": 0.05,
+            "proportional": True,
+        },
+    },
+)
+
+
+def max_weight_deviation(
+    data_dir: Path,
+    requests: list[BacktestRequest],
+    dataset: str = DEFAULT_DATASET,
+) -> float:
+    """
+    Calculate the largest absolute difference of a weight between the float32 and
+    the float64 fields.
+
+    A security selected with one precision but not with the other counts as a
+    weight of zero for the other one.
+
+    Args:
+        data_dir: Directory of the datasets
+        requests: Backtests to compare
+        dataset: Dataset of the backtests
+
+    Returns:
+        Largest absolute weight deviation over every request, date and security
+    """
+    memory_budget = 2**62
+    store64 = DatasetStore(data_dir, memory_budget)
+    store32 = DatasetStore(
+        data_dir,
+        memory_budget,
+        float32_fields=frozenset(d.value for d in SecurityValue),
+    )
+
+    deviation = 0.0
+    for request in requests:
+        request = request.model_copy(update={"dataset": dataset})
+        weights64 = run_weights_in_memory(request, store64)
+        weights32 = run_weights_in_memory(request, store32)
+        weights64, weights32 = weights64.align(weights32)
+        difference = (weights64.fillna(0.0) - weights32.fillna(0.0)).abs()
+        if not difference.empty:
+            deviation = max(deviation, float(difference.to_numpy().max()))
+    return deviation
+
+
+def report_precision(data_dir: Path, dataset: str = DEFAULT_DATASET) -> float:
+    requests = [BacktestRequest.model_validate(r) for r in DEFAULT_REQUESTS]
+    deviation = max_weight_deviation(data_dir, requests, dataset)
+    print(f"Maximum weight deviation of float32 against float64: {deviation:.3e}")
+    return deviation
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Compare the weights calculated with float32 and float64 fields"
+    )
+    parser.add_argument(
+        "--path", type=str, default="./data", help="Directory of the datasets"
+    )
+    parser.add_argument(
+        "--dataset", type=str, default=DEFAULT_DATASET, help="Dataset to compare"
+    )
+    args = parser.parse_args()
+    report_precision(Path(args.path), args.dataset)
+
+
+if __name__ == "__main__":
+    main()
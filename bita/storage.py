@@ -0,0 +1,321 @@
+from __future__ import annotations
+
+import re
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Iterable, Iterator, Sequence
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+BYTES_PER_VALUE = 8
+DEFAULT_DATASET = "default"
+DATASET_NAME = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+class DatasetNotFoundError(LookupError):
+    pass
+
+
+class ParquetField:
+    """
+    Lazy view over a field stored as a Parquet matrix of dates by securities.
+
+    Only the metadata is read when created, the values are read in batches of
+    rows and columns so a field never has to fit in memory as a whole.
+    """
+
+    __slots__ = ("file", "index_column", "securities", "dtype")
+
+    def __init__(self, path: Path, dtype: np.dtype = np.dtype(np.float64)) -> None:
+        self.file = pq.ParquetFile(path)
+        self.dtype = dtype
+        schema = self.file.schema_arrow
+        index_columns = [
+            c for c in schema.pandas_metadata["index_columns"] if isinstance(c, str)
+        ]
+        self.index_column = index_columns[0]
+        self.securities = pd.Index(
+            [name for name in schema.names if name not in index_columns]
+        )
+
+    @property
+    def num_rows(self) -> int:
+        return int(self.file.metadata.num_rows)
+
+    def size(self) -> int:
+        """Estimated size in bytes of the whole field once loaded in memory."""
+        return self.num_rows * len(self.securities) * self.dtype.itemsize
+
+    def dates(self) -> pd.DatetimeIndex:
+        return pd.DatetimeIndex(
+            self.file.read(columns=[self.index_column]).column(0).to_pandas()
+        )
+
+    def iter_rows(
+        self,
+        securities: Sequence[str],
+        dates: pd.DatetimeIndex,
+        batch_values: int,
+    ) -> Iterator[pd.DataFrame]:
+        """
+        Yield the values of the given securities at the given dates, in the order of
+        the file.
+
+        Each frame holds at most `batch_values` values, but at least one date of
+        every security. The file is read one row group at a time and each row group
+        in batches of securities, so about `batch_values` values are decoded at once
+        too, but never less than one security of a whole row group: the row groups
+        must stay small for the budget to hold.
+        """
+        yield from self._read_rows(securities, self._row_positions(dates), batch_values)
+
+    def iter_columns(
+        self,
+        dates: pd.DatetimeIndex,
+        batch_values: int,
+    ) -> Iterator[pd.DataFrame]:
+        """
+        Yield the values at the given dates for batches of securities, each frame
+        holding at most `batch_values` values but at least one security.
+
+        Each frame has its rows in the order of `dates`, as `DataFrame.loc` would.
+        """
+        batch_columns = max(1, batch_values // max(1, len(dates)))
+        row_positions = list(self._row_positions(dates))
+        for start in range(0, len(self.securities), batch_columns):
+            securities = self.securities[start : start + batch_columns]
+            frames = list(self._read_rows(securities, row_positions, batch_values))
+            if frames:
+                yield pd.concat(frames).loc[dates]
+            else:
+                yield pd.DataFrame(columns=securities, dtype=self.dtype).loc[dates]
+
+    def _row_positions(
+        self, dates: pd.DatetimeIndex
+    ) -> Iterator[tuple[int, np.ndarray, pd.DatetimeIndex]]:
+        """
+        Yield the row groups with any of the dates, with the positions of those rows
+        in the row group and their dates.
+        """
+        value_set = pa.array(dates.unique(), type=pa.timestamp("ns"))
+        for row_group in range(self.file.num_row_groups):
+            index = self.file.read_row_group(
+                row_group, columns=[self.index_column]
+            ).column(0)
+            positions = np.flatnonzero(pc.is_in(index, value_set=value_set).to_numpy())
+            if len(positions):
+                yield (
+                    row_group,
+                    positions,
+                    pd.DatetimeIndex(index.take(positions).to_pandas()),
+                )
+
+    def _read_rows(
+        self,
+        securities: Sequence[str],
+        row_positions: Iterable[tuple[int, np.ndarray, pd.DatetimeIndex]],
+        batch_values: int,
+    ) -> Iterator[pd.DataFrame]:
+        securities = list(securities)
+        batch_rows = max(1, batch_values // max(1, len(securities)))
+        for row_group, positions, dates in row_positions:
+            group_rows = self.file.metadata.row_group(row_group).num_rows
+            batch_columns = max(1, batch_values // group_rows)
+            for start in range(0, len(positions), batch_rows):
+                rows = positions[start : start + batch_rows]
+                # The row group is decoded again for each batch of rows, so that
+                # only one batch of rows of every security is held at once
+                columns: dict[str, pa.ChunkedArray] = {}
+                for c in range(0, len(securities), batch_columns):
+                    table = self.file.read_row_group(
+                        row_group, columns=securities[c : c + batch_columns]
+                    ).take(rows)
+                    columns.update(zip(table.column_names, table.columns, strict=True))
+                df = _cast_values(pa.table(columns), [], self.dtype).to_pandas()
+                df.index = dates[start : start + batch_rows]
+                yield df
+
+
+class DatasetCounters:
+    __slots__ = ("hits", "misses", "evictions", "load_time")
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.load_time = 0.0
+
+
+class DatasetStore:
+    """
+    In-process store of the fields of several named datasets.
+
+    The default dataset is made of the Parquet files directly under `root` and any
+    other dataset of the ones in a subdirectory named after it. Fields are loaded
+    the first time they are requested and the least recently used ones are evicted
+    once the loaded fields take more than `memory_budget` bytes. The fields in
+    `float32_fields` are held as float32, halving their memory.
+    """
+
+    __slots__ = (
+        "root",
+        "memory_budget",
+        "float32_fields",
+        "_fields",
+        "_counters",
+        "_lock",
+    )
+
+    def __init__(
+        self,
+        root: Path,
+        memory_budget: int,
+        float32_fields: frozenset[str] = frozenset(),
+    ) -> None:
+        self.root = root
+        self.memory_budget = memory_budget
+        self.float32_fields = float32_fields
+        self._fields: OrderedDict[tuple[str, str], pd.DataFrame] = OrderedDict()
+        self._counters: dict[str, DatasetCounters] = {}
+        self._lock = threading.Lock()
+
+    def datasets(self) -> list[str]:
+        names = [DEFAULT_DATASET] if any(self.root.glob("*.parquet")) else []
+        if self.root.is_dir():
+            names.extend(
+                sorted(
+                    d.name
+                    for d in self.root.iterdir()
+                    if d.is_dir() and DATASET_NAME.match(d.name)
+                )
+            )
+        return names
+
+    def path(self, dataset: str, field: str) -> Path:
+        if not DATASET_NAME.match(dataset):
+            raise DatasetNotFoundError(f"Unknown dataset: {dataset}")
+        directory = self.root if dataset == DEFAULT_DATASET else self.root / dataset
+        if not directory.is_dir():
+            raise DatasetNotFoundError(f"Unknown dataset: {dataset}")
+        return directory / f"{field}.parquet"
+
+    def dtype(self, field: str) -> np.dtype:
+        return np.dtype(np.float32 if field in self.float32_fields else np.float64)
+
+    def field(self, dataset: str, field: str) -> ParquetField:
+        return ParquetField(self.path(dataset, field), self.dtype(field))
+
+    def is_resident(self, dataset: str, field: str) -> bool:
+        return (dataset, field) in self._fields
+
+    def read(
+        self, dataset: str, field: str, columns: list[str] | None = None
+    ) -> pd.DataFrame:
+        """
+        Read a field, or some of its securities, from disk without keeping it.
+
+        The values are cast to the dtype of the field by Arrow before being converted
+        to a DataFrame, so a float32 field never has a float64 copy in memory.
+        """
+        table = pq.read_table(
+            self.path(dataset, field), columns=columns, use_pandas_metadata=True
+        )
+        index_columns = [
+            c
+            for c in table.schema.pandas_metadata["index_columns"]
+            if isinstance(c, str)
+        ]
+        return _cast_values(table, index_columns, self.dtype(field)).to_pandas()
+
+    def get(self, dataset: str, field: str) -> pd.DataFrame:
+        """
+        Return a field, loading it from disk if it isn't in the store.
+
+        A field larger than the whole memory budget is returned without being kept.
+        """
+        key = (dataset, field)
+        # Validated first so that unknown datasets are never counted
+        self.path(dataset, field)
+        with self._lock:
+            counters = self._counters.setdefault(dataset, DatasetCounters())
+            df = self._fields.get(key)
+            if df is not None:
+                self._fields.move_to_end(key)
+                counters.hits += 1
+                return df
+
+        start_time = time.perf_counter()
+        df = self.read(dataset, field)
+        load_time = time.perf_counter() - start_time
+
+        with self._lock:
+            counters.misses += 1
+            counters.load_time += load_time
+            size = _frame_size(df)
+            if size <= self.memory_budget:
+                self._fields[key] = df
+                self._evict(self.memory_budget - size, keep=key)
+        return df
+
+    def stats(self) -> list[dict]:
+        with self._lock:
+            names = dict.fromkeys([*self.datasets(), *self._counters])
+            stats = []
+            for name in names:
+                counters = self._counters.get(name, DatasetCounters())
+                resident = {
+                    field: _frame_size(df)
+                    for (dataset, field), df in self._fields.items()
+                    if dataset == name
+                }
+                stats.append(
+                    {
+                        "name": name,
+                        "hits": counters.hits,
+                        "misses": counters.misses,
+                        "evictions": counters.evictions,
+                        "load_time": counters.load_time,
+                        "resident_bytes": sum(resident.values()),
+                        "resident_fields": list(resident),
+                    }
+                )
+            return stats
+
+    def clear(self) -> None:
+        with self._lock:
+            self._fields.clear()
+            self._counters.clear()
+
+    def _evict(self, budget: int, keep: tuple[str, str]) -> None:
+        size = sum(_frame_size(df) for k, df in self._fields.items() if k != keep)
+        for key in list(self._fields):
+            if size <= budget:
+                break
+            if key == keep:
+                continue
+            size -= _frame_size(self._fields.pop(key))
+            self._counters[key[0]].evictions += 1
+
+
+def _cast_values(
+    data: pa.Table | pa.RecordBatch, index_columns: list[str], dtype: np.dtype
+) -> pa.Table | pa.RecordBatch:
+    value_type = pa.from_numpy_dtype(dtype)
+    schema = pa.schema(
+        [
+            f if f.name in index_columns else f.with_type(value_type)
+            for f in data.schema
+        ],
+        metadata=data.schema.metadata,
+    )
+    return data.cast(schema)
+
+
+def _frame_size(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(index=True).sum())
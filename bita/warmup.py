@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import logging
+import os
+import time
+
+from .application import ExecutionMode, LoadStatus, SecurityValue
+from .domain import STORE, run_backtest
+from .dtos import BacktestRequest, ReadinessResponse
+from .storage import BYTES_PER_VALUE, DEFAULT_DATASET
+
+logger = logging.getLogger(__name__)
+
+# Datasets and fields loaded into the store before the instance is ready
+PRELOAD_DATASETS = os.environ.get("BITA_PRELOAD_DATASETS", DEFAULT_DATASET)
+PRELOAD_FIELDS = os.environ.get(
+    "BITA_PRELOAD_FIELDS", ",".join(d.value for d in SecurityValue)
+)
+
+
+class WarmUp:
+    """
+    Preloads fields into the store and runs a few synthetic backtests, so the
+    first requests don't pay for loading the data and first-call overheads.
+
+    Only the fields that fit in the store together are preloaded, in the order
+    they are given, the others are skipped. The instance is only ready while every
+    preloaded field is still resident in the store, a field evicted since it was
+    loaded is reported as such.
+    """
+
+    __slots__ = ("fields", "warm_up_time", "_finished")
+
+    def __init__(self, datasets: list[str], fields: list[str]) -> None:
+        self.fields = {
+            dataset: dict.fromkeys(fields, LoadStatus.PENDING) for dataset in datasets
+        }
+        self.warm_up_time: float | None = None
+        self._finished = False
+
+    @classmethod
+    def from_environment(cls) -> WarmUp:
+        return cls(
+            [d for d in PRELOAD_DATASETS.split(",") if d],
+            [f for f in PRELOAD_FIELDS.split(",") if f],
+        )
+
+    @property
+    def ready(self) -> bool:
+        return self._finished and all(
+            status in (LoadStatus.LOADED, LoadStatus.SKIPPED)
+            for fields in self.statuses().values()
+            for status in fields.values()
+        )
+
+    def statuses(self) -> dict[str, dict[str, LoadStatus]]:
+        return {
+            dataset: {
+                field: LoadStatus.EVICTED
+                if status == LoadStatus.LOADED and not STORE.is_resident(dataset, field)
+                else status
+                for field, status in fields.items()
+            }
+            for dataset, fields in self.fields.items()
+        }
+
+    def readiness(self) -> ReadinessResponse:
+        return ReadinessResponse(
+            ready=self.ready,
+            warm_up_time=self.warm_up_time,
+            fields=self.statuses(),
+        )
+
+    def run(self) -> None:
+        start_time = time.perf_counter()
+        self._skip_over_budget()
+        for dataset, fields in self.fields.items():
+            for field in fields:
+                if fields[field] == LoadStatus.SKIPPED:
+                    continue
+                fields[field] = LoadStatus.LOADING
+                try:
+                    STORE.get(dataset, field)
+                    fields[field] = LoadStatus.LOADED
+                except Exception:
+                    logger.exception("Error loading %s of dataset %s", field, dataset)
+                    fields[field] = LoadStatus.FAILED
+
+            try:
+                self._run_backtests(dataset)
+            except Exception:
+                logger.exception("Error warming up the backtests of %s", dataset)
+
+        self.warm_up_time = time.perf_counter() - start_time
+        self._finished = True
+        logger.info("Warm-up finished in %.2f seconds", self.warm_up_time)
+
+    def _skip_over_budget(self) -> None:
+        """
+        Skip the fields that don't fit in the store with the ones before them,
+        otherwise loading them would evict those.
+        """
+        size = 0
+        for dataset, fields in self.fields.items():
+            for field in fields:
+                try:
+                    parquet_field = STORE.field(dataset, field)
+                except Exception:
+                    # Reported as failed when loading it
+                    continue
+                field_size = (
+                    parquet_field.size() + parquet_field.num_rows * BYTES_PER_VALUE
+                )
+                if size + field_size > STORE.memory_budget:
+                    logger.warning(
+                        "Not preloading %s of dataset %s, %.0f MB over the %.0f MB "
+                        "of BITA_STORE_MEMORY_MB",
+                        field,
+                        dataset,
+                        (size + field_size - STORE.memory_budget) / 1024**2,
+                        STORE.memory_budget / 1024**2,
+                    )
+                    fields[field] = LoadStatus.SKIPPED
+                else:
+                    size += field_size
+
+    def _run_backtests(self, dataset: str) -> None:
+        loaded = [
+            field
+            for field, status in self.fields[dataset].items()
+            if status == LoadStatus.LOADED
+        ]
+        if not loaded:
+            return
+
+        dates = [str(STORE.get(dataset, loaded[0]).index[-1].date())]
+        d = loaded[0]
+        for backtest_filter, weighting_method in (
+            ({"n": 5, "d": d}, {"d": d}),
+            ({"p": 1.0, "d": d}, {"d": d, "lb": 0.0001, "ub": 0.5}),
+            (
+                {"expression": {"d": d, "n": 5, "within": {"d": d, "gt": 1.0}}},
+                {"d": d, "proportional": True},
+            ),
+        ):
+            run_backtest(
+                BacktestRequest.model_validate(
+                    {
+                        "calendar_rule": {"dates": dates},
+                        "backtest_filter": backtest_filter,
+                        "weighting_method": weighting_method,
+                        "execution_mode": ExecutionMode.IN_MEMORY,
+                        "dataset": dataset,
+                    }
+                )
+            )
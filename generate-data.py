@@ -1,43 +1,232 @@
 import argparse
 import os
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 
+DATA_FIELD_IDENTIFIERS = (
+    "market_capitalization",
+    "prices",
+    "volume",
+    "adtv_3_month",
+)
 
-def generate_data(path: str, num_securities: int):
+# Every source of randomness has its own stream, so each field can be generated in
+# its own process and still be consistent with the fields it is derived from
+RANDOM_STREAMS = (
+    *DATA_FIELD_IDENTIFIERS,
+    "securities",
+    "market",
+    "returns",
+    "volume_noise",
+)
+
+ADTV_WINDOW = 63
+BYTES_PER_VALUE = 8
+
+
+def generate_data(
+    path: str,
+    num_securities: int,
+    seed: int | None = None,
+    chunk_mb: int = 64,
+    workers: int | None = None,
+    distribution: str = "uniform",
+):
     """
     Generate dummy data for testing the backtesting API.
 
+    Each field is written by its own process in chunks of about `chunk_mb` MB of
+    dates, one Parquet row group per chunk, so the memory used doesn't depend on the
+    number of dates and the row groups stay large enough to be read efficiently.
+
     Args:
         path: Path to save the Parquet files
         num_securities: Number of securities to generate
+        seed: Seed of the random numbers, the same seed generates the same data
+        chunk_mb: Megabytes of values generated and written at once
+        workers: Number of processes, one per field by default
+        distribution: "uniform" values between 1 and 100, or "realistic" correlated
+            prices, heavy-tailed market capitalization and ADTV derived from volume
     """
 
     os.makedirs(path, exist_ok=True)
 
-    data_field_identifiers = (
-        "market_capitalization",
-        "prices",
-        "volume",
-        "adtv_3_month",
+    entropy = np.random.SeedSequence(seed).entropy
+    print(f"Generating data with seed {entropy}")
+
+    dates = pd.date_range("2020-01-01", "2025-07-12")
+    chunk_size = max(1, chunk_mb * 1024**2 // (num_securities * BYTES_PER_VALUE))
+
+    with ProcessPoolExecutor(
+        max_workers=workers or min(len(DATA_FIELD_IDENTIFIERS), os.cpu_count() or 1)
+    ) as executor:
+        futures = [
+            executor.submit(
+                _write_field,
+                path,
+                data_field_identifier,
+                dates,
+                num_securities,
+                entropy,
+                chunk_size,
+                distribution,
+            )
+            for data_field_identifier in DATA_FIELD_IDENTIFIERS
+        ]
+        for future in as_completed(futures):
+            print(f"Saved {future.result()}")
+
+
+def _write_field(
+    path: str,
+    data_field_identifier: str,
+    dates: pd.DatetimeIndex,
+    num_securities: int,
+    entropy: int,
+    chunk_size: int,
+    distribution: str,
+) -> str:
+    streams = dict(
+        zip(
+            RANDOM_STREAMS,
+            np.random.SeedSequence(entropy).spawn(len(RANDOM_STREAMS)),
+            strict=True,
+        )
     )
+    if distribution == "uniform":
+        chunks = _uniform_chunks(
+            streams[data_field_identifier], len(dates), num_securities, chunk_size
+        )
+    else:
+        chunks = _realistic_chunks(
+            data_field_identifier, streams, len(dates), num_securities, chunk_size
+        )
 
     securities = list(map(str, range(num_securities)))
+    file_path = os.path.join(path, f"{data_field_identifier}.parquet")
+    writer: pq.ParquetWriter | None = None
+    start = 0
+    try:
+        for data in chunks:
+            df = pd.DataFrame(
+                data, index=dates[start : start + len(data)], columns=securities
+            )
+            start += len(data)
+            if writer is None:
+                table = pa.Table.from_pandas(df)
+                writer = pq.ParquetWriter(file_path, table.schema)
+            else:
+                table = pa.Table.from_pandas(df, schema=writer.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+    return file_path
 
-    dates = pd.date_range("2020-01-01", "2025-07-12")
 
-    for data_field_identifier in data_field_identifiers:
-        print(f"Generating {data_field_identifier} data...")
+def _chunk_rows(num_dates: int, chunk_size: int) -> Iterator[int]:
+    for start in range(0, num_dates, chunk_size):
+        yield min(chunk_size, num_dates - start)
 
-        data = np.random.uniform(low=1, high=100, size=(len(dates), num_securities))
 
-        file_path = os.path.join(path, f"{data_field_identifier}.parquet")
-        pd.DataFrame(data, index=dates, columns=securities).to_parquet(file_path)
-        print(f"Saved {file_path}")
+def _uniform_chunks(
+    stream: np.random.SeedSequence, num_dates: int, num_securities: int, chunk_size: int
+) -> Iterator[np.ndarray]:
+    rng = np.random.default_rng(stream)
+    for rows in _chunk_rows(num_dates, chunk_size):
+        yield rng.uniform(low=1, high=100, size=(rows, num_securities))
 
 
-if __name__ == "__main__":
+def _realistic_chunks(
+    data_field_identifier: str,
+    streams: dict[str, np.random.SeedSequence],
+    num_dates: int,
+    num_securities: int,
+    chunk_size: int,
+) -> Iterator[np.ndarray]:
+    rng = np.random.default_rng(streams["securities"])
+    initial_prices = rng.lognormal(mean=np.log(50), sigma=1.0, size=num_securities)
+    betas = rng.uniform(0.5, 1.5, size=num_securities)
+    volatilities = rng.uniform(0.01, 0.03, size=num_securities)
+    # Pareto shares outstanding make the market capitalization heavy-tailed
+    shares = (rng.pareto(1.2, size=num_securities) + 1) * 1e6
+    turnover = rng.uniform(0.001, 0.01, size=num_securities)
+
+    prices = _price_chunks(
+        streams, num_dates, chunk_size, initial_prices, betas, volatilities
+    )
+    volumes = _volume_chunks(streams, num_dates, chunk_size, shares * turnover)
+
+    if data_field_identifier == "prices":
+        yield from prices
+    elif data_field_identifier == "market_capitalization":
+        for price in prices:
+            yield price * shares
+    elif data_field_identifier == "volume":
+        yield from volumes
+    elif data_field_identifier == "adtv_3_month":
+        yield from _rolling_mean_chunks(
+            (price * volume for price, volume in zip(prices, volumes, strict=True)),
+            ADTV_WINDOW,
+        )
+    else:
+        raise ValueError(f"Unknown data field {data_field_identifier}")
+
+
+def _price_chunks(
+    streams: dict[str, np.random.SeedSequence],
+    num_dates: int,
+    chunk_size: int,
+    initial_prices: np.ndarray,
+    betas: np.ndarray,
+    volatilities: np.ndarray,
+) -> Iterator[np.ndarray]:
+    """
+    Prices following a one factor model: every security moves with the market,
+    scaled by its beta, plus its own noise.
+    """
+    market_rng = np.random.default_rng(streams["market"])
+    returns_rng = np.random.default_rng(streams["returns"])
+    log_prices = np.log(initial_prices)
+    for rows in _chunk_rows(num_dates, chunk_size):
+        market = market_rng.normal(0.0003, 0.01, size=(rows, 1))
+        noise = returns_rng.standard_normal((rows, len(log_prices)))
+        path = log_prices + np.cumsum(market * betas + noise * volatilities, axis=0)
+        log_prices = path[-1]
+        yield np.exp(path)
+
+
+def _volume_chunks(
+    streams: dict[str, np.random.SeedSequence],
+    num_dates: int,
+    chunk_size: int,
+    mean_volumes: np.ndarray,
+) -> Iterator[np.ndarray]:
+    rng = np.random.default_rng(streams["volume_noise"])
+    for rows in _chunk_rows(num_dates, chunk_size):
+        yield mean_volumes * rng.lognormal(0.0, 0.5, size=(rows, len(mean_volumes)))
+
+
+def _rolling_mean_chunks(
+    chunks: Iterator[np.ndarray], window: int
+) -> Iterator[np.ndarray]:
+    """
+    Rolling mean over the dates, carrying the last `window - 1` dates between chunks.
+    """
+    tail: np.ndarray | None = None
+    for chunk in chunks:
+        data = chunk if tail is None else np.vstack((tail, chunk))
+        mean = pd.DataFrame(data).rolling(window, min_periods=1).mean().to_numpy()
+        yield mean[len(data) - len(chunk) :]
+        tail = data[-(window - 1) :]
+
+
+def main():
     parser = argparse.ArgumentParser(description="Generate dummy data for backtesting")
     parser.add_argument(
         "--path", type=str, default="./data", help="Path to save the Parquet files"
@@ -48,8 +237,56 @@ if __name__ == "__main__":
         default=100_000,
         help="Number of securities to generate",
     )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help="Seed of the random numbers, for reproducible data",
+    )
+    parser.add_argument(
+        "--chunk_mb",
+        type=int,
+        default=64,
+        help="Megabytes of values generated and written at once",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of processes generating the fields",
+    )
+    parser.add_argument(
+        "--distribution",
+        type=str,
+        choices=("uniform", "realistic"),
+        default="uniform",
+        help="Distribution of the generated values",
+    )
+    parser.add_argument(
+        "--verify_precision",
+        action="store_true",
+        help="Report the maximum weight deviation of float32 fields against float64",
+    )
 
     args = parser.parse_args()
-    generate_data(args.path, args.num_securities)
+    generate_data(
+        args.path,
+        args.num_securities,
+        seed=args.seed,
+        chunk_mb=args.chunk_mb,
+        workers=args.workers,
+        distribution=args.distribution,
+    )
 
     print("Data generation complete!")
+
+    if args.verify_precision:
+        from pathlib import Path
+
+        from bita.precision import report_precision
+
+        report_precision(Path(args.path))
+
+
+if __name__ == "__main__":
+    main()
@@ -16,7 +16,8 @@ def all_security_values():
 def all_weighting_methods(d: str):
     lb = round(random.uniform(0.01, 1.0), 3) if random.choice((True, False)) else None
     ub = round(random.uniform(0.01, 1.0), 3) if random.choice((True, False)) else None
-    return {"d": d, "lb": lb, "ub": ub}
+    proportional = random.choice((True, False))
+    return {"d": d, "lb": lb, "ub": ub, "proportional": proportional}
 
 
 def all_filters(d: str):
@@ -1,12 +1,16 @@
+import numpy as np
 import pandas as pd
+import pytest
 from pandas.testing import assert_frame_equal, assert_index_equal
 
 from bita import domain
 from bita.application import (
+    BacktestFilterExpression,
     BacktestFilterLowerThanP,
     BacktestFilterTopN,
     CustomDatesRule,
     QuarterlyDatesRule,
+    SecurityValue,
     WeightingMethod,
 )
 
@@ -154,3 +158,202 @@ def test_calculate_optimized_weights():
         orient="index",
     )
     assert_frame_equal(result, expected)
+
+
+def test_calculate_index_levels():
+    prices = pd.DataFrame(
+        {
+            "0": [10.0, 11.0, 12.0, 12.0],
+            "1": [20.0, 20.0, 10.0, 15.0],
+        },
+        index=pd.to_datetime(["2024-01-01", "2024-01-02", "2024-01-03", "2024-01-04"]),
+    )
+    weights = pd.DataFrame(
+        {"0": [0.5, 0.5], "1": [0.5, 0.5]},
+        index=pd.to_datetime(["2024-01-01", "2024-01-03"]),
+    )
+
+    levels, turnover, drift = domain._calculate_index_levels(weights, prices, 100.0)
+
+    expected_levels = pd.Series(
+        [100.0, 105.0, 85.0, 106.25],
+        index=prices.index,
+    )
+    pd.testing.assert_series_equal(levels, expected_levels)
+    pd.testing.assert_series_equal(
+        turnover,
+        pd.Series(
+            [1.0, 0.5 - 0.25 / 0.85],
+            index=weights.index,
+        ),
+    )
+    pd.testing.assert_series_equal(
+        drift,
+        pd.Series([0.5 - 0.25 / 0.85], index=weights.index[1:]),
+    )
+
+
+def test_weighting_method_capped_proportional():
+    config = WeightingMethod(
+        d="market_capitalization", lb=0.05, ub=0.4, proportional=True
+    )
+    values = {
+        "0": [50.0, 60.0, 40.0],
+        "1": [30.0, 30.0, 30.0],
+        "2": [15.0, 5.0, 20.0],
+        "3": [5.0, 5.0, 10.0],
+    }
+    index = pd.to_datetime(["2024-01-01", "2024-01-15", "2024-02-01"])
+    data = pd.DataFrame(values, index=index)
+
+    result = domain._calculate_weights(config, data.columns, data, index)
+
+    expected = pd.DataFrame(
+        {
+            "0": [0.4, 0.4, 0.4],
+            "1": [0.6 / 50 * 30, 0.4, 0.3],
+            "2": [0.6 / 50 * 15, 0.1, 0.2],
+            "3": [0.6 / 50 * 5, 0.1, 0.1],
+        },
+        index=index,
+    )
+    assert_frame_equal(result, expected)
+
+
+def test_weighting_method_capped_proportional_sticky_bounds():
+    # Recomputing the capped securities from scratch alternates between {4} and
+    # {2, 3, 4} for these values and breaks the cap
+    data = pd.DataFrame([[0.624, 0.083, 0.914, 1.322, 9.913]])
+
+    result = domain._calculate_capped_proportional_weights(data, lb=0.08, ub=0.29)
+
+    scale = 0.34 / (0.624 + 0.914)
+    expected = pd.DataFrame([[0.624 * scale, 0.08, 0.914 * scale, 0.29, 0.29]])
+    assert_frame_equal(result, expected)
+
+
+def test_weighting_method_capped_proportional_frees_capped_securities():
+    # Capped at ub at first, the largest security goes back below it once the
+    # others are raised to lb
+    data = pd.DataFrame([[100.0, 1.0, 1.0, 1.0]])
+
+    result = domain._calculate_capped_proportional_weights(data, lb=0.2, ub=0.5)
+
+    assert_frame_equal(result, pd.DataFrame([[0.4, 0.2, 0.2, 0.2]]))
+
+
+def test_weighting_method_capped_proportional_random_bounds():
+    rng = np.random.default_rng(1)
+    data = pd.DataFrame(rng.lognormal(0.0, 2.0, size=(200, 20)))
+    data[data > 20] = np.nan
+
+    result = domain._calculate_capped_proportional_weights(data, lb=0.02, ub=0.15)
+
+    weights = result.to_numpy()
+    selected = ~np.isnan(weights)
+    assert (weights[selected] >= 0.02 - 1e-12).all()
+    assert (weights[selected] <= 0.15 + 1e-12).all()
+    np.testing.assert_allclose(np.nansum(weights, axis=1), 1.0)
+
+
+def test_weighting_method_capped_proportional_infeasible_bounds():
+    data = pd.DataFrame([[1.0, 2.0, 3.0]])
+
+    with pytest.raises(ValueError, match="cannot be bounded"):
+        domain._calculate_capped_proportional_weights(data, lb=0.0, ub=0.3)
+
+
+def test_filter_expression():
+    index = pd.to_datetime(["2024-01-01", "2024-01-15", "2024-02-01"])
+    prices = pd.DataFrame(
+        {
+            "0": [10.0, 10.0, 1.0],
+            "1": [10.0, 1.0, 1.0],
+            "2": [10.0, 10.0, 1.0],
+            "3": [1.0, 10.0, 1.0],
+        },
+        index=index,
+    )
+    market_cap = pd.DataFrame(
+        {
+            "0": [100.0, 400.0, 100.0],
+            "1": [300.0, 300.0, 300.0],
+            "2": [200.0, 200.0, 200.0],
+            "3": [400.0, 100.0, 400.0],
+        },
+        index=index,
+    )
+    # Top 2 by market cap within the securities with prices above 5
+    filter_config = BacktestFilterExpression.model_validate(
+        {
+            "expression": {
+                "d": "market_capitalization",
+                "n": 2,
+                "within": {
+                    "all": [
+                        {"d": "prices", "gt": 5.0},
+                        {"not": {"d": "market_capitalization", "lt": 150.0}},
+                    ]
+                },
+            }
+        }
+    )
+
+    result = filter_config.select(
+        {SecurityValue.PRICES: prices, SecurityValue.MARKET_CAP: market_cap}
+    )
+
+    expected = pd.DataFrame(
+        {
+            "0": [False, True, False],
+            "1": [True, False, False],
+            "2": [True, True, False],
+        },
+        index=index,
+    )
+    assert_frame_equal(result, expected)
+
+
+def test_weighting_method_equal_weight_selection():
+    config = WeightingMethod(d="prices")
+    index = pd.to_datetime(["2024-01-01", "2024-01-15"])
+    data = pd.DataFrame(
+        {"0": [1.0, 2.0], "1": [3.0, 4.0], "2": [5.0, 6.0]}, index=index
+    )
+    selection = pd.DataFrame(
+        {"0": [True, True], "1": [True, False], "2": [False, True]}, index=index
+    )
+
+    result = domain._calculate_weights(
+        config, selection.columns, data, index, selection
+    )
+
+    expected = pd.DataFrame(
+        {"0": [0.5, 0.5], "1": [0.5, None], "2": [None, 0.5]}, index=index
+    )
+    assert_frame_equal(result, expected)
+
+
+def test_weighting_method_capped_proportional_float32():
+    config = WeightingMethod(d="market_capitalization", ub=0.4, proportional=True)
+    index = pd.to_datetime(["2024-01-01", "2024-01-15"])
+    data = pd.DataFrame(
+        {"0": [50.0, 60.0], "1": [30.0, 30.0], "2": [15.0, 5.0], "3": [5.0, 5.0]},
+        index=index,
+    )
+
+    result = domain._calculate_weights(config, data.columns, data, index)
+    result32 = domain._calculate_weights(
+        config, data.columns, data.astype("float32"), index
+    )
+
+    assert (result32.dtypes == "float64").all()
+    assert (result32.sum(axis=1) == 1.0).all()
+    assert_frame_equal(result32, result, atol=1e-6)
+
+
+def test_float32_fields_validated():
+    assert domain._parse_float32_fields("prices, volume") == {"prices", "volume"}
+    assert len(domain._parse_float32_fields("all")) == len(SecurityValue)
+    with pytest.raises(ValueError, match="pricez"):
+        domain._parse_float32_fields("prices,pricez")
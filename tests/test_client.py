@@ -0,0 +1,93 @@
+import asyncio
+
+import httpx
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+from bita import app
+from bita.client import AsyncBacktestClient, BacktestClient, weights_frame
+from bita.dtos import BacktestRequest, BacktestResponse
+
+
+def _request(n: int) -> BacktestRequest:
+    return BacktestRequest.model_validate(
+        {
+            "calendar_rule": {"dates": ["2024-01-01", "2024-01-15"]},
+            "backtest_filter": {"n": n, "d": "market_capitalization"},
+            "weighting_method": {"d": "volume"},
+        }
+    )
+
+
+def test_weights_frame():
+    response = BacktestResponse(
+        execution_time=0.1,
+        weights={"2024-01-01": {"0": 0.5, "1": 0.5}, "2024-01-15": {"0": 1.0}},
+    )
+
+    result = weights_frame(response)
+
+    expected = pd.DataFrame(
+        {"0": [0.5, 1.0], "1": [0.5, None]},
+        index=pd.DatetimeIndex(["2024-01-01", "2024-01-15"]),
+    )
+    assert_frame_equal(result, expected)
+
+
+def test_client_backtest_many():
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        return httpx.Response(
+            200, json={"execution_time": 0.1, "weights": {"2024-01-01": {"0": 1.0}}}
+        )
+
+    with BacktestClient(transport=httpx.MockTransport(handler)) as client:
+        responses = client.backtest_many([_request(1), _request(2), _request(3)])
+
+    assert len(calls) == 3
+    assert [r.weights for r in responses] == [
+        {pd.Timestamp("2024-01-01").date(): {"0": 1.0}}
+    ] * 3
+
+
+def test_async_client_coalesces_identical_requests():
+    sent = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        sent.append(request)
+        return await transport.handle_async_request(request)
+
+    transport = httpx.ASGITransport(app=app)
+
+    async def run() -> list[BacktestResponse]:
+        async with AsyncBacktestClient(
+            "http://test", max_concurrency=2, transport=httpx.MockTransport(handler)
+        ) as client:
+            return await client.backtest_many([_request(5), _request(5), _request(3)])
+
+    responses = asyncio.run(run())
+
+    assert len(sent) == 2
+    assert responses[0] == responses[1]
+    assert len(next(iter(responses[2].weights.values()))) == 3
+
+
+def test_weights_frame_delta():
+    response = BacktestResponse(
+        execution_time=0.1,
+        weights={"2024-01-01": {"0": 0.5, "1": 0.5}},
+        deltas={
+            "2024-01-15": {"updated": {"2": 0.5}, "removed": ["1"]},
+            "2024-02-01": {"updated": {"0": 0.4, "1": 0.2, "2": 0.4}},
+        },
+    )
+
+    result = weights_frame(response)
+
+    expected = pd.DataFrame(
+        {"0": [0.5, 0.5, 0.4], "1": [0.5, None, 0.2], "2": [None, 0.5, 0.4]},
+        index=pd.DatetimeIndex(["2024-01-01", "2024-01-15", "2024-02-01"]),
+    )
+    assert_frame_equal(result, expected)
@@ -1,6 +1,15 @@
+import time
+
+import pandas as pd
+import pytest
 from fastapi.testclient import TestClient
+from pandas.testing import assert_frame_equal
 
-from bita import app
+from bita import app, domain
+from bita.application import LoadStatus
+from bita.client import decode_weights, index_frame, weights_frame
+from bita.dtos import BacktestResponse, IndexLevelResponse
+from bita.warmup import WarmUp
 
 client = TestClient(app)
 
@@ -40,3 +49,227 @@ def test_quarterly_dates_optimized_weight():
 
     response = client.post("/backtest", json=payload)
     assert response.status_code == 200
+
+
+def test_custom_dates_index_levels():
+    payload = {
+        "calendar_rule": {"dates": ["2024-01-01", "2024-01-15", "2024-02-01"]},
+        "backtest_filter": {"n": 5, "d": "market_capitalization"},
+        "weighting_method": {
+            "d": "volume",
+        },
+        "initial_level": 1000.0,
+    }
+
+    response = client.post("/backtest/index", json=payload)
+    assert response.status_code == 200
+    body = response.json()
+    assert body["levels"]["2024-01-01"] == 1000.0
+    assert body["turnover"]["2024-01-01"] == 1.0
+    assert list(body["drift"]) == ["2024-01-15", "2024-02-01"]
+
+
+def test_index_levels_hold_cash_without_securities():
+    dates = ["2024-01-01", "2024-01-15", "2024-02-01"]
+    prices = domain.STORE.get("default", "prices").loc[dates]
+    # No security is selected at the date with the lowest maximum price
+    empty_date = prices.max(axis=1).idxmin()
+    payload = {
+        "calendar_rule": {"dates": dates},
+        "backtest_filter": {
+            "expression": {"d": "prices", "gt": float(prices.max(axis=1).min())}
+        },
+        "weighting_method": {"d": "volume"},
+        "initial_level": 1000.0,
+    }
+
+    response = client.post("/backtest/index", json=payload)
+    assert response.status_code == 200
+    body = response.json()
+    assert body["levels"]["2024-01-01"] == 1000.0
+    levels = index_frame(IndexLevelResponse.model_validate(body))["level"]
+    assert (levels > 0).all()
+    # Held in cash until the next rebalance date
+    next_dates = [d for d in pd.to_datetime(dates) if d > empty_date]
+    cash = levels.loc[empty_date : next_dates[0] if next_dates else None]
+    assert (cash == cash.iloc[0]).all()
+
+
+@pytest.mark.parametrize(
+    ("backtest_filter", "weighting_method"),
+    [
+        ({"n": 5, "d": "market_capitalization"}, {"d": "volume"}),
+        ({"p": 30.0, "d": "prices"}, {"d": "volume", "lb": 0.001, "ub": 0.4}),
+    ],
+)
+def test_out_of_core_matches_in_memory(monkeypatch, backtest_filter, weighting_method):
+    # A small budget forces several batches of securities
+    monkeypatch.setattr(domain, "MEMORY_BUDGET", 8 * 1024**2)
+    payload = {
+        "calendar_rule": {"dates": ["2024-02-01", "2024-01-01", "2024-01-15"]},
+        "backtest_filter": backtest_filter,
+        "weighting_method": weighting_method,
+    }
+
+    in_memory = client.post(
+        "/backtest", json={**payload, "execution_mode": "in_memory"}
+    )
+    out_of_core = client.post(
+        "/backtest", json={**payload, "execution_mode": "out_of_core"}
+    )
+
+    assert in_memory.status_code == 200
+    assert out_of_core.status_code == 200
+    assert out_of_core.json()["weights"] == in_memory.json()["weights"]
+    assert list(out_of_core.json()["weights"]) == [
+        "2024-02-01",
+        "2024-01-01",
+        "2024-01-15",
+    ]
+
+
+def test_unknown_dataset():
+    payload = {
+        "calendar_rule": {"dates": ["2024-01-01"]},
+        "backtest_filter": {"n": 5, "d": "market_capitalization"},
+        "weighting_method": {"d": "volume"},
+        "dataset": "unknown",
+    }
+
+    response = client.post("/backtest", json=payload)
+    assert response.status_code == 404
+
+
+def test_datasets_stats():
+    response = client.get("/datasets")
+    assert response.status_code == 200
+    assert "default" in [dataset["name"] for dataset in response.json()]
+
+
+def test_filter_expression_top_n_within_threshold():
+    payload = {
+        "calendar_rule": {"dates": ["2024-01-01", "2024-01-15", "2024-02-01"]},
+        "backtest_filter": {
+            "expression": {
+                "d": "market_capitalization",
+                "n": 10,
+                "within": {
+                    "all": [
+                        {"d": "adtv_3_month", "gt": 20.0},
+                        {"d": "prices", "gt": 50.0},
+                    ]
+                },
+            }
+        },
+        "weighting_method": {"d": "market_capitalization", "proportional": True},
+    }
+
+    response = client.post("/backtest", json=payload)
+    assert response.status_code == 200
+    for weights in response.json()["weights"].values():
+        assert len(weights) == 10
+        assert sum(weights.values()) == pytest.approx(1.0)
+
+
+def test_filter_expression_out_of_core_rejected():
+    payload = {
+        "calendar_rule": {"dates": ["2024-01-01"]},
+        "backtest_filter": {"expression": {"d": "prices", "gt": 50.0}},
+        "weighting_method": {"d": "volume"},
+        "execution_mode": "out_of_core",
+    }
+
+    response = client.post("/backtest", json=payload)
+    assert response.status_code == 422
+
+
+def test_delta_weights_match_full_weights():
+    payload = {
+        "calendar_rule": {"initial_date": "2023-01-01"},
+        "backtest_filter": {"p": 20.0, "d": "prices"},
+        "weighting_method": {"d": "volume", "proportional": True},
+    }
+
+    full = client.post("/backtest", json=payload)
+    delta = client.post(
+        "/backtest", json={**payload, "delta": True, "delta_tolerance": 0.001}
+    )
+
+    assert full.status_code == 200
+    assert delta.status_code == 200
+    assert "deltas" not in full.json()
+    decoded = weights_frame(BacktestResponse.model_validate(delta.json()))
+    expected = weights_frame(BacktestResponse.model_validate(full.json()))
+    assert_frame_equal(decoded, expected, check_like=True, atol=0.001, rtol=0)
+
+
+def test_delta_weights_in_calendar_order():
+    payload = {
+        "calendar_rule": {"dates": ["2024-02-01", "2024-01-01", "2024-01-15"]},
+        "backtest_filter": {"n": 5, "d": "market_capitalization"},
+        "weighting_method": {"d": "volume", "proportional": True},
+    }
+
+    full = client.post("/backtest", json=payload).json()
+    delta = client.post("/backtest", json={**payload, "delta": True}).json()
+
+    assert list(delta["weights"]) == ["2024-02-01"]
+    assert list(delta["deltas"]) == ["2024-01-01", "2024-01-15"]
+    decoded = decode_weights(BacktestResponse.model_validate(delta))
+    assert {str(d): w for d, w in decoded.items()} == full["weights"]
+
+
+def test_ready_after_warm_up():
+    with TestClient(app) as warm_client:
+        deadline = time.monotonic() + 30
+        response = warm_client.get("/ready")
+        while response.status_code == 503 and time.monotonic() < deadline:
+            time.sleep(0.05)
+            response = warm_client.get("/ready")
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["ready"]
+    assert set(body["fields"]["default"].values()) == {"loaded"}
+
+
+def test_warm_up_not_ready_with_missing_field():
+    warm_up = WarmUp(["default"], ["prices", "missing"])
+    assert not warm_up.ready
+
+    warm_up.run()
+
+    readiness = warm_up.readiness()
+    assert not readiness.ready
+    assert readiness.fields["default"] == {
+        "prices": LoadStatus.LOADED,
+        "missing": LoadStatus.FAILED,
+    }
+
+
+def test_warm_up_not_ready_once_evicted():
+    warm_up = WarmUp(["default"], ["prices"])
+    warm_up.run()
+    assert warm_up.ready
+
+    domain.STORE.clear()
+
+    readiness = warm_up.readiness()
+    assert not readiness.ready
+    assert readiness.fields["default"] == {"prices": LoadStatus.EVICTED}
+
+
+def test_warm_up_skips_fields_over_memory_budget(monkeypatch):
+    size = domain.STORE.get("default", "prices").memory_usage(index=True).sum()
+    monkeypatch.setattr(domain.STORE, "memory_budget", int(1.5 * size))
+    domain.STORE.clear()
+    warm_up = WarmUp(["default"], ["prices", "volume"])
+
+    warm_up.run()
+
+    readiness = warm_up.readiness()
+    assert readiness.ready
+    assert readiness.fields["default"] == {
+        "prices": LoadStatus.LOADED,
+        "volume": LoadStatus.SKIPPED,
+    }
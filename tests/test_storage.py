@@ -0,0 +1,86 @@
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from pandas.testing import assert_frame_equal
+
+from bita.storage import DatasetNotFoundError, DatasetStore
+
+
+def _write_field(path, name: str) -> pd.DataFrame:
+    df = pd.DataFrame(
+        {"0": [1.0, 2.0], "1": [3.0, 4.0]},
+        index=pd.to_datetime(["2024-01-01", "2024-01-02"]),
+    )
+    path.mkdir(parents=True, exist_ok=True)
+    df.to_parquet(path / f"{name}.parquet")
+    return df
+
+
+def test_dataset_store_lru_eviction(tmp_path):
+    df = _write_field(tmp_path, "prices")
+    _write_field(tmp_path, "volume")
+    _write_field(tmp_path / "europe", "prices")
+    size = int(df.memory_usage(index=True).sum())
+    store = DatasetStore(tmp_path, memory_budget=2 * size)
+
+    store.get("default", "prices")
+    store.get("default", "volume")
+    store.get("default", "prices")
+    store.get("europe", "prices")
+
+    assert store.is_resident("default", "prices")
+    assert not store.is_resident("default", "volume")
+    assert store.is_resident("europe", "prices")
+
+    stats = {s["name"]: s for s in store.stats()}
+    assert stats["default"]["hits"] == 1
+    assert stats["default"]["misses"] == 2
+    assert stats["default"]["evictions"] == 1
+    assert stats["default"]["resident_fields"] == ["prices"]
+    assert stats["europe"]["resident_bytes"] == size
+
+
+def test_dataset_store_unknown_dataset(tmp_path):
+    _write_field(tmp_path, "prices")
+    store = DatasetStore(tmp_path, memory_budget=1024)
+
+    with pytest.raises(DatasetNotFoundError):
+        store.get("asia", "prices")
+    with pytest.raises(DatasetNotFoundError):
+        store.get("../etc", "prices")
+    with pytest.raises(DatasetNotFoundError):
+        store.path("../default", "prices")
+
+    assert [s["name"] for s in store.stats()] == ["default"]
+
+
+def test_dataset_store_float32_fields(tmp_path):
+    _write_field(tmp_path, "prices")
+    _write_field(tmp_path, "volume")
+    store = DatasetStore(tmp_path, 1024**2, float32_fields=frozenset(["prices"]))
+
+    assert (store.get("default", "prices").dtypes == "float32").all()
+    assert (store.get("default", "volume").dtypes == "float64").all()
+    assert store.field("default", "prices").size() == 2 * 2 * 4
+    assert (store.read("default", "prices", columns=["1"]).dtypes == "float32").all()
+
+
+def test_parquet_field_batches_row_groups(tmp_path):
+    index = pd.date_range("2024-01-01", periods=7)
+    df = pd.DataFrame(
+        {str(i): [float(i * 10 + j) for j in range(7)] for i in range(5)}, index=index
+    )
+    pq.write_table(
+        pa.Table.from_pandas(df), tmp_path / "prices.parquet", row_group_size=3
+    )
+    field = DatasetStore(tmp_path, 1024).field("default", "prices")
+    dates = index[[5, 0, 2, 3]]
+
+    frames = list(field.iter_rows(["4", "1", "2"], dates, batch_values=4))
+    by_columns = list(field.iter_columns(dates, batch_values=8))
+
+    assert all(frame.size <= 4 for frame in frames)
+    assert_frame_equal(pd.concat(frames), df.loc[index[[0, 2, 3, 5]], ["4", "1", "2"]])
+    assert [frame.shape for frame in by_columns] == [(4, 2), (4, 2), (4, 1)]
+    assert_frame_equal(pd.concat(by_columns, axis=1), df.loc[dates])